@@ -6,8 +6,8 @@ Main Streamlit Application
 import streamlit as st
 import os
 from backend.document_processor import DocumentProcessor
-from backend.ai_assistant import AIAssistant
-from backend.question_generator import QuestionGenerator
+from backend.ai_assistant import get_ai_assistant
+from backend.question_generator import get_question_generator
 
 # Configure Streamlit page
 st.set_page_config(
@@ -32,13 +32,19 @@ if 'challenge_mode' not in st.session_state:
     st.session_state.challenge_mode = False
 if 'question_answered' not in st.session_state:
     st.session_state.question_answered = False
+if 'question_set' not in st.session_state:
+    st.session_state.question_set = 0
+if 'pending_evaluation' not in st.session_state:
+    st.session_state.pending_evaluation = None
 
-# Initialize components
+# Initialize components once per process; they hold API clients and the tokenizer
 
+@st.cache_resource
 def get_components():
-    return DocumentProcessor(), AIAssistant(), QuestionGenerator()
+    return DocumentProcessor(), get_ai_assistant(), get_question_generator()
 
 doc_processor, ai_assistant, question_generator = get_components()
+ai_assistant.ensure_session()
 
 def main():
     st.title("📚 Smart Research Assistant")
@@ -78,7 +84,12 @@ def main():
         if st.session_state.summary:
             st.markdown(f"**Summary:** {st.session_state.summary}")
         else:
-            st.warning("Summary not available. Please reprocess the document.")
+            st.warning("Summary not available.")
+            if st.button("Generate Summary"):
+                st.session_state.summary = stream_markdown(
+                    st.empty(),
+                    ai_assistant.generate_summary_stream(st.session_state.document_text)
+                ).strip()
         
         st.divider()
         
@@ -136,15 +147,25 @@ def process_document(uploaded_file):
         if success:
             st.session_state.document_text = text_content
             st.session_state.document_name = uploaded_file.name
+            tokens = doc_processor.load_or_encode_tokens(uploaded_file, text_content, ai_assistant.encode_document)
+            # Index long documents now, so the first question does not wait for embeddings
+            ai_assistant.prepare_document(text_content, tokens)
             
-            # Generate summary
+            # Summary and first challenge questions come from one combined request
             with st.spinner("Generating summary..."):
-                summary = ai_assistant.generate_summary(text_content)
-                st.session_state.summary = summary
+                bootstrap = ai_assistant.bootstrap_document(text_content, num_questions=3)
+                st.session_state.summary = bootstrap['summary']
+                
+                questions = bootstrap['questions']
+                if len(questions) < 3:
+                    questions = question_generator.generate_challenge_questions(text_content, num_questions=3)
             
-            # Clear previous session data
-            st.session_state.challenge_questions = []
+            # Reset session data for the new document
+            st.session_state.challenge_questions = questions
+            st.session_state.question_set = 0
+            st.session_state.pending_evaluation = None
             st.session_state.current_question_index = 0
+            st.session_state.question_answered = False
             st.session_state.challenge_mode = False
             ai_assistant.clear_conversation_history()
             
@@ -153,12 +174,24 @@ def process_document(uploaded_file):
         else:
             st.error(f"❌ Error processing document: {error_msg}")
 
+def stream_markdown(placeholder, chunks) -> str:
+    """Render streamed text into a placeholder as it arrives and return the full text"""
+    # st.write_stream needs Streamlit 1.31+, so render the stream manually
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
+
 def clear_document():
     """Clear current document and reset session"""
     st.session_state.document_text = ""
     st.session_state.document_name = ""
     st.session_state.summary = ""
     st.session_state.challenge_questions = []
+    st.session_state.question_set = 0
+    st.session_state.pending_evaluation = None
     st.session_state.current_question_index = 0
     st.session_state.challenge_mode = False
     st.session_state.question_answered = False
@@ -176,22 +209,25 @@ def display_ask_anything_mode():
     )
     
     if st.button("Get Answer", type="primary") and question:
-        with st.spinner("Analyzing document and generating answer..."):
-            answer, justification = ai_assistant.answer_question(
-                question, 
+        # Stream the answer as it is generated, then split off the justification
+        st.markdown("### 💡 Answer:")
+        answer_placeholder = st.empty()
+        full_response = stream_markdown(
+            answer_placeholder,
+            ai_assistant.answer_question_stream(
+                question,
                 st.session_state.document_text,
                 st.session_state.get('conversation_history', [])
             )
-            
-            # Display answer
-            st.markdown("### 💡 Answer:")
-            st.markdown(answer)
-            
-            st.markdown("### 📝 Justification:")
-            st.markdown(justification)
-            
-            # Add to conversation history
-            ai_assistant.add_to_conversation_history(question, answer)
+        )
+        answer, justification = ai_assistant.split_answer(full_response)
+        answer_placeholder.markdown(answer)
+        
+        st.markdown("### 📝 Justification:")
+        st.markdown(justification)
+        
+        # Add to conversation history
+        ai_assistant.add_to_conversation_history(question, answer)
     
     # Display conversation history
     if st.session_state.get('conversation_history'):
@@ -207,10 +243,17 @@ def generate_challenge_questions():
     """Generate challenge questions"""
     if not st.session_state.challenge_questions:
         with st.spinner("Generating challenge questions..."):
-            questions = question_generator.generate_challenge_questions(
+            # Questions stream in one by one; show progress as each arrives
+            progress = st.empty()
+            questions = []
+            for question in question_generator.generate_challenge_questions_stream(
                 st.session_state.document_text, 
-                num_questions=3
-            )
+                num_questions=3,
+                variant=st.session_state.question_set
+            ):
+                questions.append(question)
+                progress.caption(f"Generated {len(questions)} of 3 questions")
+            progress.empty()
             st.session_state.challenge_questions = questions
             st.session_state.current_question_index = 0
             st.session_state.question_answered = False
@@ -245,12 +288,25 @@ def display_challenge_mode():
             height=100
         )
         
+        st.toggle(
+            "Background (cheaper)",
+            key="background_evaluation",
+            help="Grade through the OpenAI Batch API at half the cost. Results can take several minutes."
+        )
+        
         col1, col2, col3 = st.columns([1, 1, 1])
         
         with col1:
             if st.button("Submit Answer", type="primary") and user_answer:
                 evaluate_answer(current_question, user_answer)
         
+        # An answer queued for batch grading is collected on a later rerun
+        pending = st.session_state.pending_evaluation
+        if pending is not None and pending['question'] == current_question:
+            st.info("⏳ Your answer is queued for grading. Batch results can take several minutes.")
+            if st.button("Check Results"):
+                check_background_evaluation(current_question)
+        
         with col2:
             if st.button("Skip Question") and current_idx < total_questions - 1:
                 st.session_state.current_question_index += 1
@@ -260,6 +316,8 @@ def display_challenge_mode():
         with col3:
             if st.button("New Questions"):
                 st.session_state.challenge_questions = []
+                st.session_state.question_set += 1
+                st.session_state.pending_evaluation = None
                 generate_challenge_questions()
                 st.rerun()
     
@@ -267,11 +325,28 @@ def display_challenge_mode():
         st.success("🎉 You've completed all challenge questions!")
         if st.button("Generate New Questions"):
             st.session_state.challenge_questions = []
+            st.session_state.question_set += 1
+            st.session_state.pending_evaluation = None
             generate_challenge_questions()
             st.rerun()
 
 def evaluate_answer(question, user_answer):
     """Evaluate user's answer to challenge question"""
+    if st.session_state.get('background_evaluation'):
+        # Queue the answer and return; the batch is polled on later reruns
+        try:
+            batch_id = ai_assistant.submit_evaluations_batch(
+                [(question['question'], user_answer, question['expected_answer'])],
+                st.session_state.document_text
+            )
+        except Exception as e:
+            st.error(f"Error submitting answer for grading: {str(e)}")
+            return
+        
+        # The pending notice below the buttons picks it up on this run
+        st.session_state.pending_evaluation = {'batch_id': batch_id, 'question': question}
+        return
+    
     with st.spinner("Evaluating your answer..."):
         evaluation, feedback, score = ai_assistant.evaluate_user_answer(
             question['question'],
@@ -279,42 +354,61 @@ def evaluate_answer(question, user_answer):
             question['expected_answer'],
             st.session_state.document_text
         )
-        
-        st.session_state.question_answered = True
-        
-        # Display evaluation
-        st.markdown("---")
-        st.markdown("### 📊 Evaluation Results")
-        
-        # Score display with color coding
-        if score >= 8:
-            st.success(f"🎉 **{evaluation}** - Score: {score}/10")
-        elif score >= 6:
-            st.warning(f"⚠️ **{evaluation}** - Score: {score}/10")
-        else:
-            st.error(f"❌ **{evaluation}** - Score: {score}/10")
-        
-        st.markdown("### 💭 Feedback:")
-        st.markdown(feedback)
-        
-        # Expected answer
-        st.markdown("### 📚 Expected Answer Points:")
-        st.markdown(question['expected_answer'])
-        
-        # Navigation
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if (st.session_state.current_question_index < len(st.session_state.challenge_questions) - 1 and
-                st.button("Next Question", type="primary")):
-                st.session_state.current_question_index += 1
-                st.session_state.question_answered = False
-                st.rerun()
-        
-        with col2:
-            if st.button("Back to Ask Anything"):
-                st.session_state.challenge_mode = False
-                st.rerun()
+    
+    display_evaluation(question, evaluation, feedback, score)
+
+def check_background_evaluation(question):
+    """Show the grade of an answer queued with the Batch API, if it is ready"""
+    with st.spinner("Checking the batch queue..."):
+        results = ai_assistant.fetch_evaluations_batch(
+            st.session_state.pending_evaluation['batch_id'], 1
+        )
+    
+    if results is None:
+        st.info("Results are not ready yet. Check again in a few minutes.")
+        return
+    
+    st.session_state.pending_evaluation = None
+    evaluation, feedback, score = results[0]
+    display_evaluation(question, evaluation, feedback, score)
+
+def display_evaluation(question, evaluation, feedback, score):
+    """Display the evaluation of an answer to a challenge question"""
+    st.session_state.question_answered = True
+    
+    # Display evaluation
+    st.markdown("---")
+    st.markdown("### 📊 Evaluation Results")
+    
+    # Score display with color coding
+    if score >= 8:
+        st.success(f"🎉 **{evaluation}** - Score: {score}/10")
+    elif score >= 6:
+        st.warning(f"⚠️ **{evaluation}** - Score: {score}/10")
+    else:
+        st.error(f"❌ **{evaluation}** - Score: {score}/10")
+    
+    st.markdown("### 💭 Feedback:")
+    st.markdown(feedback)
+    
+    # Expected answer
+    st.markdown("### 📚 Expected Answer Points:")
+    st.markdown(question['expected_answer'])
+    
+    # Navigation
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if (st.session_state.current_question_index < len(st.session_state.challenge_questions) - 1 and
+            st.button("Next Question", type="primary")):
+            st.session_state.current_question_index += 1
+            st.session_state.question_answered = False
+            st.rerun()
+    
+    with col2:
+        if st.button("Back to Ask Anything"):
+            st.session_state.challenge_mode = False
+            st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
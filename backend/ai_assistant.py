@@ -4,25 +4,327 @@ Handles question answering and document analysis using OpenAI
 """
 
 import os
+import asyncio
+import json
+import logging
+import random
+import time
+import threading
 import openai
-from typing import Dict, List, Optional, Tuple
+import httpx
+import blake3
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import streamlit as st
 from dotenv import load_dotenv
 import tiktoken
+import numpy as np
+import orjson
+import msgspec
+from backend import batch_client
+from backend.retrieval import ANSWER_TOP_K, CHUNK_TOKENS, DocumentIndex, get_document_index, split_tokens
+from backend.semantic_cache import EMBEDDING_MODEL, get_semantic_cache
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Throttling for concurrent API calls: cap in-flight requests below the
+# account rate limit and back off exponentially when a 429 comes back anyway.
+# The clients are built with max_retries=0, so these are the only retries and
+# no request is retried while it holds a slot.
+MAX_CONCURRENT_REQUESTS = 8
+MAX_RATE_LIMIT_RETRIES = 5
+INITIAL_BACKOFF_SECONDS = 1.0
+
+# Errors worth retrying: rate limits, dropped connections and timeouts, and
+# server-side failures (the cases the SDK's own retry loop would cover)
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# Connection pool shared by every API client. HTTP/2 multiplexes concurrent
+# requests over a few connections, so TLS handshakes are paid once per process
+HTTP_POOL_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=40)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_request_slots: Optional[asyncio.Semaphore] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop that runs all async API calls"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="openai-event-loop", daemon=True).start()
+    return _loop
+
+
+def _get_request_slots() -> asyncio.Semaphore:
+    """Return the semaphore limiting in-flight requests (created on the loop thread)"""
+    global _request_slots
+    if _request_slots is None:
+        _request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _request_slots
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide HTTP client for openai.AsyncOpenAI
+    
+    Its connections are only ever used from the background event loop, so one
+    pool can serve every client in every session.
+    """
+    global _http_client
+    with _loop_lock:
+        if _http_client is None:
+            _http_client = httpx.AsyncClient(
+                http2=True,
+                timeout=openai.DEFAULT_TIMEOUT,
+                limits=HTTP_POOL_LIMITS,
+                follow_redirects=True
+            )
+    return _http_client
+
+
+def run_many(coros: Iterable[Awaitable]) -> List[Any]:
+    """
+    Run independent coroutines concurrently and return their results in order
+    
+    All coroutines share one long-lived background event loop instead of a fresh
+    asyncio.run() per call, so the AsyncOpenAI connection pool is never bound to
+    a closed loop and concurrent Streamlit sessions can submit work safely.
+    
+    Args:
+        coros: Coroutines (or other awaitables) to run
+        
+    Returns:
+        List of results in the same order as the inputs
+    """
+    async def gather():
+        return await asyncio.gather(*coros)
+    
+    return asyncio.run_coroutine_threadsafe(gather(), _get_event_loop()).result()
+
+
+def iter_async(agen: AsyncIterator) -> Iterator:
+    """
+    Iterate an async generator from synchronous code
+    
+    Each item is awaited on the background event loop, so streamed responses
+    can be consumed directly from the Streamlit script thread.
+    """
+    loop = _get_event_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+async def with_rate_limit_backoff(make_request):
+    """
+    Await make_request() under the shared concurrency limit, retrying with
+    jittered exponential backoff when the API responds with 429 or fails transiently
+    """
+    delay = INITIAL_BACKOFF_SECONDS
+    for attempt in range(MAX_RATE_LIMIT_RETRIES):
+        async with _get_request_slots():
+            try:
+                return await make_request()
+            except RETRYABLE_ERRORS:
+                if attempt == MAX_RATE_LIMIT_RETRIES - 1:
+                    raise
+        # Sleep outside the semaphore so other requests can use the slot
+        await asyncio.sleep(delay + random.uniform(0, delay))
+        delay *= 2
+
+
+# Rules shared by every request. They come first and are followed by the document
+# excerpt, so the system message is byte-identical across summary and evaluation
+# calls on the same document (and Q&A on documents too short to be indexed) and
+# OpenAI prompt caching can reuse it. Indexed Q&A swaps in the chunks retrieved
+# for each question, so only the rules are shared there.
+DOCUMENT_SYSTEM_RULES = """You are an AI research assistant working with a single document, which is provided below.
+
+Rules:
+1. Base every response strictly on the document content
+2. If information is not in the document, say "This information is not available in the document"
+3. Justify answers and feedback by referencing specific parts of the document
+4. Be concise but comprehensive
+5. Do not make assumptions or add external knowledge"""
+
+# Token budget of the document excerpt in the system message; it must be the same
+# for every call so the prefix stays identical. Longer documents are chunked and
+# indexed, answers then use the chunks retrieved for each question.
+DOCUMENT_EXCERPT_TOKENS = 2500
+
+# Seconds before a document whose index could not be built is indexed again;
+# until then its requests use the start of the document
+INDEX_RETRY_SECONDS = 300.0
+
+# Embeddings API limits: inputs per request and total input tokens per request
+EMBEDDING_BATCH_SIZE = 2048
+EMBEDDING_MAX_REQUEST_TOKENS = 300000
+
+# Tokens allowed per chunk on top of CHUNK_TOKENS when batching embeddings.
+# Chunks are decoded from token slices, so a character split at a boundary
+# becomes U+FFFD and the API can count a few more tokens than the slice had.
+EMBEDDING_CHUNK_TOKEN_MARGIN = 16
+
+
+# Structured output schema for answer evaluations
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "evaluation": {"type": "string", "enum": ["Correct", "Partially Correct", "Incorrect"]},
+        "feedback": {"type": "string"},
+        "score": {"type": "integer", "minimum": 1, "maximum": 10}
+    },
+    "required": ["evaluation", "feedback", "score"],
+    "additionalProperties": False
+}
+
+EVALUATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "evaluation", "strict": True, "schema": EVALUATION_SCHEMA}
+}
+
+BULK_EVALUATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "evaluations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"evaluations": {"type": "array", "items": EVALUATION_SCHEMA}},
+            "required": ["evaluations"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Completion budget per challenge question in a JSON response, shared by every
+# request that returns questions so all of them are cut off (or not) alike. It
+# is a ceiling, not a target: generation stops when the JSON closes, so unused
+# budget costs nothing, while a response that runs past the limit loses its
+# last question to a generic fallback.
+MAX_TOKENS_PER_QUESTION = 250
+
+
+class ChallengeQuestion(msgspec.Struct):
+    """
+    A generated challenge question, validated the same way for every request that returns questions
+    
+    Missing or null labels get their defaults; an empty question or expected
+    answer fails validation.
+    """
+    question: str
+    expected_answer: str
+    difficulty: Optional[str] = "Medium"
+    type: Optional[str] = "comprehension"
+    
+    def __post_init__(self):
+        self.question = self.question.strip()
+        self.expected_answer = self.expected_answer.strip()
+        if not self.question or not self.expected_answer:
+            raise ValueError("question and expected_answer must not be empty")
+        if self.difficulty is None:
+            self.difficulty = "Medium"
+        if self.type is None:
+            self.type = "comprehension"
+
+
+# Decodes one question object straight from JSON text into a validated struct
+CHALLENGE_QUESTION_DECODER = msgspec.json.Decoder(ChallengeQuestion)
+
+
+def clean_question(data: Any) -> Optional[Dict]:
+    """Validate an already-parsed question object, returning it in canonical form or None"""
+    try:
+        return msgspec.structs.asdict(msgspec.convert(data, ChallengeQuestion))
+    except msgspec.ValidationError:
+        return None
+
+
+# Earlier exchanges included in the prompt of an answer
+ANSWER_CONTEXT_EXCHANGES = 3
+
+SUMMARY_PROMPT = """
+Please provide a concise summary of the document in exactly 150 words or less.
+Focus on the main topics, key findings, and important conclusions.
+
+Summary (≤150 words):
+"""
+
+# Upper bound on the size of a chunk encoded at a time during truncation
+TRUNCATION_CHUNK_CHARS = 8192
+
+
+def _iter_text_chunks(text: str, chunk_chars: int = TRUNCATION_CHUNK_CHARS) -> Iterable[str]:
+    """
+    Yield consecutive chunks of text, preferring paragraph breaks
+    
+    Each chunk is at most chunk_chars long and ends at the last paragraph break,
+    line break or space before that limit when there is one, so chunks can be
+    encoded separately with (almost) the same tokens as the whole text.
+    """
+    start = 0
+    while start < len(text):
+        end = start + chunk_chars
+        if end >= len(text):
+            yield text[start:]
+            return
+        
+        for separator in ("\n\n", "\n", " "):
+            split = text.rfind(separator, start, end)
+            if split > start:
+                end = split + len(separator)
+                break
+        
+        yield text[start:end]
+        start = end
+
+
+@st.cache_data(
+    show_spinner=False,
+    hash_funcs={str: lambda s: blake3.blake3(s.encode()).digest()}
+)
+def _encode_cached(text: str) -> Tuple[int, ...]:
+    """Encode text with cl100k_base once per distinct text"""
+    return tuple(tiktoken.get_encoding("cl100k_base").encode(text))
+
 class AIAssistant:
     """Main AI assistant for document analysis and question answering"""
     
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=get_http_client(),
+            max_retries=0  # with_rate_limit_backoff retries instead
+        )
         self.model = "gpt-4o-mini"
         self.max_tokens = 4000
         self.temperature = 0.1  # Low temperature for more consistent responses
         self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.cache = get_semantic_cache()
+        
+        # Last document hashed, so repeat calls on the same text are free
+        self._hash_memo: Optional[Tuple[str, str]] = None
+        # When indexing last failed, by document hash, so failures are not retried on every call
+        self._index_failures: Dict[str, float] = {}
+    
+    def ensure_session(self):
+        """
+        Initialize per-session state
         
+        Kept out of __init__ so a single instance can be shared across reruns
+        and sessions with st.cache_resource; call it on every script run.
+        """
         # Session state for conversation history
         if 'conversation_history' not in st.session_state:
             st.session_state.conversation_history = []
@@ -31,15 +333,190 @@ class AIAssistant:
         """Count tokens in text"""
         return len(self.encoding.encode(text))
     
+    def document_hash(self, document_text: str) -> str:
+        """Return the BLAKE3 hex digest of the document, memoized for the last document seen"""
+        memo = self._hash_memo
+        if memo is not None and memo[0] is document_text:
+            return memo[1]
+        
+        digest = blake3.blake3(document_text.encode()).hexdigest()
+        self._hash_memo = (document_text, digest)
+        return digest
+    
+    def encode_document(self, document_text: str) -> Tuple[int, ...]:
+        """Return the tokens of the document, encoding each distinct document only once"""
+        return _encode_cached(document_text)
+    
     def truncate_text(self, text: str, max_tokens: int = 3000) -> str:
-        """Truncate text to fit within token limit"""
-        tokens = self.encoding.encode(text)
-        if len(tokens) <= max_tokens:
+        """
+        Truncate text to fit within token limit
+        
+        Args:
+            text: Full text
+            max_tokens: Token budget
+            
+        Returns:
+            Text of at most max_tokens tokens
+        """
+        # Every token covers at least one UTF-8 byte (but byte-level BPE can
+        # split a multi-byte character into several tokens)
+        if len(text) <= max_tokens and len(text.encode("utf-8")) <= max_tokens:
             return text
         
-        # Keep the first part of the document
-        truncated_tokens = tokens[:max_tokens]
-        return self.encoding.decode(truncated_tokens)
+        # Encode chunk by chunk and stop once the budget is exceeded, so the rest
+        # of a long document is never encoded
+        tokens: List[int] = []
+        for part in _iter_text_chunks(text):
+            tokens.extend(self.encoding.encode(part))
+            if len(tokens) > max_tokens:
+                # Keep the first part of the document
+                return self.encoding.decode(tokens[:max_tokens])
+        
+        return text
+    
+    def prepare_document(self, document_text: str, tokens: Sequence[int]) -> str:
+        """
+        Index a document when it is uploaded
+        
+        Documents longer than the excerpt budget are split into chunks that are
+        embedded and indexed for retrieval; their excerpt is then the first chunk
+        plus evenly spaced later chunks, so summaries and evaluations see the
+        whole document rather than its start. Calling this at upload time means
+        the first question does not wait for the embeddings.
+        
+        Args:
+            document_text: Full document text
+            tokens: Tokens of document_text (e.g. from DocumentProcessor.load_or_encode_tokens)
+            
+        Returns:
+            The document excerpt used by summary and evaluation calls
+        """
+        index = self._document_index(self.document_hash(document_text), lambda: tokens)
+        return self._document_excerpt(document_text, index)
+    
+    def document_index(self, document_text: str) -> Optional[DocumentIndex]:
+        """
+        Return the retrieval index of a long document, or None for short ones
+        
+        The index is fetched from the shared cache by document hash (and rebuilt
+        if it was evicted), so it must be called on the Streamlit script thread;
+        the sync methods below call it and pass the index to their async
+        implementations. The document is only encoded when the index has to be
+        built: a cached index (or a cached "too short") costs a hash lookup.
+        """
+        # Every token is at least one byte, so short texts need no lookup at all
+        if len(document_text) <= DOCUMENT_EXCERPT_TOKENS and len(document_text.encode("utf-8")) <= DOCUMENT_EXCERPT_TOKENS:
+            return None
+        return self._document_index(self.document_hash(document_text), lambda: self.encode_document(document_text))
+    
+    def _document_index(self, doc_hash: str, load_tokens: Callable[[], Sequence[int]]) -> Optional[DocumentIndex]:
+        """Fetch or build the index of a document (None if short or on failure); load_tokens runs on a miss"""
+        failed_at = self._index_failures.get(doc_hash)
+        if failed_at is not None and time.monotonic() - failed_at < INDEX_RETRY_SECONDS:
+            return None
+        
+        try:
+            index = get_document_index(doc_hash, lambda: self._decode_chunks(load_tokens()), self._embed_chunks)
+        except Exception:
+            # Without embeddings, fall back to the start of the document
+            logger.warning("Could not index document %s, using its start for %.0f s",
+                           doc_hash[:12], INDEX_RETRY_SECONDS, exc_info=True)
+            self._index_failures[doc_hash] = time.monotonic()
+            return None
+        
+        self._index_failures.pop(doc_hash, None)
+        return index
+    
+    def _decode_chunks(self, tokens: Sequence[int]) -> List[str]:
+        """Decode the retrieval chunks of an encoded document, or none if it fits in the excerpt"""
+        if len(tokens) <= DOCUMENT_EXCERPT_TOKENS:
+            return []
+        # tiktoken decodes natively without the GIL, so the batch runs on parallel threads
+        array = np.asarray(tokens)
+        return self.encoding.decode_batch([array[start:stop].tolist() for start, stop in split_tokens(tokens)])
+    
+    def _embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Embed document chunks in as few requests as the API allows (called on the script thread)"""
+        batch_size = min(EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_REQUEST_TOKENS // (CHUNK_TOKENS + EMBEDDING_CHUNK_TOKEN_MARGIN))
+        return run_many([self._aembed_many(chunks, batch_size)])[0]
+    
+    def _document_excerpt(self, document_text: str, index: Optional[DocumentIndex]) -> str:
+        """Return the excerpt of the document sent with summary and evaluation calls"""
+        if index is not None:
+            return index.overview()
+        return self.truncate_text(document_text, DOCUMENT_EXCERPT_TOKENS)
+    
+    def _system_message(self, excerpt: str) -> str:
+        """Build the system message holding the rules and a document excerpt"""
+        return f"{DOCUMENT_SYSTEM_RULES}\n\nDocument:\n{excerpt}"
+    
+    def _document_messages(self, document_text: str, user_content: str,
+                           index: Optional[DocumentIndex] = None) -> List[Dict]:
+        """
+        Build the messages for a request about the document
+        
+        The system message holds the static rules followed by the document
+        excerpt (the index overview for long documents, the start of the text
+        otherwise). It is built the same way for every call on the same
+        document, so OpenAI prompt caching serves the long shared prefix from
+        cache and only the short task-specific user message is processed from
+        scratch.
+        
+        Args:
+            document_text: Full document text
+            user_content: Task-specific instructions and inputs
+            index: Index from document_index(), or None
+            
+        Returns:
+            Chat messages for the completion request
+        """
+        return [
+            {"role": "system", "content": self._system_message(self._document_excerpt(document_text, index))},
+            {"role": "user", "content": user_content}
+        ]
+    
+    async def _astream_completion(self, messages: List[Dict], max_tokens: int) -> AsyncIterator[str]:
+        """Send a throttled streaming chat completion request and yield its text deltas"""
+        stream = await self._acreate_completion(messages, max_tokens, stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def _aembed(self, text: str) -> np.ndarray:
+        """Embed text for semantic cache lookups and retrieval"""
+        return (await self._aembed_many([text]))[0]
+    
+    async def _aembed_many(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """
+        Embed a list of texts and return one float16 row per text
+        
+        The texts are sent as input lists of up to batch_size items, so a
+        document needs one request per batch rather than one per chunk. Half
+        precision halves the memory of the matrix and is ample for cosine
+        similarity.
+        """
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            response = await with_rate_limit_backoff(
+                lambda: self.client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+            )
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        
+        batches = await asyncio.gather(*(
+            embed_batch(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)
+        ))
+        return np.asarray([row for batch in batches for row in batch], dtype=np.float16)
+    
+    async def _acreate_completion(self, messages: List[Dict], max_tokens: int, **options):
+        """Send a throttled chat completion request"""
+        return await with_rate_limit_backoff(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=self.temperature,
+                **options
+            )
+        )
     
     def generate_summary(self, document_text: str) -> str:
         """
@@ -51,105 +528,291 @@ class AIAssistant:
         Returns:
             Summary text
         """
+        return run_many([self._agenerate_summary(document_text, self.document_index(document_text))])[0]
+    
+    async def _agenerate_summary(self, document_text: str, index: Optional[DocumentIndex] = None) -> str:
+        """Async implementation of generate_summary"""
         try:
-            # Truncate document if too long
-            truncated_text = self.truncate_text(document_text, 2500)
+            doc_hash = self.document_hash(document_text)
+            cached = self.cache.get("summary", doc_hash)
+            if cached is not None:
+                return cached
             
-            prompt = f"""
-            Please provide a concise summary of the following document in exactly 150 words or less. 
-            Focus on the main topics, key findings, and important conclusions.
-            
-            Document:
-            {truncated_text}
-            
-            Summary (≤150 words):
-            """
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=self.temperature
+            response = await self._acreate_completion(
+                self._document_messages(document_text, SUMMARY_PROMPT, index),
+                max_tokens=200
             )
             
             summary = response.choices[0].message.content.strip()
+            self.cache.set("summary", doc_hash, summary)
             return summary
             
         except Exception as e:
             return f"Error generating summary: {str(e)}"
     
-    def answer_question(self, question: str, document_text: str, context_history: List[Dict] = None) -> Tuple[str, str]:
+    def generate_summary_stream(self, document_text: str) -> Iterator[str]:
         """
-        Answer a question based on the document content
+        Stream the document summary as it is generated
         
         Args:
-            question: User's question
-            document_text: Full document text
-            context_history: Previous conversation context
+            document_text: Full text of the document
             
         Returns:
-            Tuple of (answer, justification)
+            Iterator over summary text chunks
         """
+        return iter_async(self._agenerate_summary_stream(document_text, self.document_index(document_text)))
+    
+    async def _agenerate_summary_stream(self, document_text: str, index: Optional[DocumentIndex] = None) -> AsyncIterator[str]:
+        """Async implementation of generate_summary_stream"""
         try:
-            # Truncate document if too long
-            truncated_text = self.truncate_text(document_text, 2500)
+            doc_hash = self.document_hash(document_text)
+            cached = self.cache.get("summary", doc_hash)
+            if cached is not None:
+                yield cached
+                return
             
-            # Build context from history
-            context = ""
-            if context_history:
-                context = "\n\nPrevious conversation:\n"
-                for entry in context_history[-3:]:  # Keep last 3 exchanges
-                    context += f"Q: {entry['question']}\nA: {entry['answer']}\n"
+            chunks = []
+            async for chunk in self._astream_completion(
+                self._document_messages(document_text, SUMMARY_PROMPT, index),
+                max_tokens=200
+            ):
+                chunks.append(chunk)
+                yield chunk
+            
+            self.cache.set("summary", doc_hash, "".join(chunks).strip())
+            
+        except Exception as e:
+            yield f"Error generating summary: {str(e)}"
+    
+    def bootstrap_document(self, document_text: str, num_questions: int = 3) -> Dict:
+        """
+        Generate the summary and the first set of challenge questions in one request
+        
+        Both artifacts come from a single JSON response, so the document excerpt
+        is sent (and billed) once instead of once per artifact.
+        
+        Args:
+            document_text: Full text of the document
+            num_questions: Number of challenge questions to generate
+            
+        Returns:
+            Dict with 'summary' text and a 'questions' list of question dictionaries
+        """
+        return run_many([self._abootstrap_document(document_text, num_questions, self.document_index(document_text))])[0]
+    
+    async def _abootstrap_document(self, document_text: str, num_questions: int = 3,
+                                   index: Optional[DocumentIndex] = None) -> Dict:
+        """Async implementation of bootstrap_document"""
+        try:
+            doc_hash = self.document_hash(document_text)
+            cache_key = f"{doc_hash}:{num_questions}"
+            cached = self.cache.get("bootstrap", cache_key)
+            if cached is not None:
+                return cached
             
             prompt = f"""
-            You are an AI assistant analyzing a document. Answer the user's question based ONLY on the information provided in the document.
+            Prepare this document for a study session by producing:
+            1. A concise summary of the document in 150 words or less, focusing on the main topics, key findings, and important conclusions
+            2. Exactly {num_questions} challenging questions that test reading comprehension, critical thinking, analysis and inference, and understanding of key concepts
             
-            Rules:
-            1. Base your answer strictly on the document content
-            2. If information is not in the document, say "This information is not available in the document"
-            3. Provide a clear justification referencing specific parts of the document
-            4. Be concise but comprehensive
-            5. Do not make assumptions or add external knowledge
+            Questions should require understanding the document content, not just memorization.
+            Avoid simple factual questions. Focus on analysis, comparison, inference, and application.
             
-            Document:
-            {truncated_text}
+            Format your response as a JSON object:
+            {{
+                "summary": "Summary (≤150 words)",
+                "questions": [
+                    {{
+                        "question": "Your question here",
+                        "expected_answer": "Key points for the answer",
+                        "difficulty": "Easy/Medium/Hard",
+                        "type": "comprehension/analysis/inference"
+                    }}
+                ]
+            }}
+            """
             
-            {context}
+            response = await self._acreate_completion(
+                self._document_messages(document_text, prompt, index),
+                max_tokens=200 + MAX_TOKENS_PER_QUESTION * num_questions,
+                response_format={"type": "json_object"}
+            )
             
-            Question: {question}
+            data = orjson.loads(response.choices[0].message.content)
             
-            Please provide your answer followed by a justification that references specific parts of the document.
+            questions = [question for question in map(clean_question, data.get('questions', [])) if question is not None]
             
-            Answer:
-            """
+            result = {
+                'summary': str(data.get('summary', '')).strip(),
+                'questions': questions[:num_questions]
+            }
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=400,
-                temperature=self.temperature
+            if result['summary']:
+                self.cache.set("summary", doc_hash, result['summary'])
+                self.cache.set("bootstrap", cache_key, result)
+            
+            return result
+            
+        except Exception as e:
+            return {'summary': f"Error generating summary: {str(e)}", 'questions': []}
+    
+    def answer_question(self, question: str, document_text: str, context_history: List[Dict] = None) -> Tuple[str, str]:
+        """
+        Answer a question based on the document content
+        
+        Args:
+            question: User's question
+            document_text: Full document text
+            context_history: Previous conversation context
+            
+        Returns:
+            Tuple of (answer, justification)
+        """
+        return run_many([
+            self._aanswer_question(question, document_text, context_history, self.document_index(document_text))
+        ])[0]
+    
+    async def _aanswer_question(self, question: str, document_text: str, context_history: List[Dict] = None,
+                                index: Optional[DocumentIndex] = None) -> Tuple[str, str]:
+        """Async implementation of answer_question"""
+        try:
+            # Near-duplicates of earlier questions on this document are served from the cache
+            scope = self._answer_scope(self.document_hash(document_text), context_history)
+            cached, question_embedding = await self._alookup_answer(question, scope)
+            if cached is not None:
+                return cached
+            
+            response = await self._acreate_completion(
+                self._build_answer_messages(question, document_text, context_history, question_embedding, index),
+                max_tokens=400
             )
             
-            full_response = response.choices[0].message.content.strip()
+            answer, justification = self.split_answer(response.choices[0].message.content)
             
-            # Try to separate answer and justification
-            if "justification:" in full_response.lower():
-                parts = full_response.split("Justification:", 1)
-                if len(parts) == 2:
-                    answer = parts[0].strip()
-                    justification = parts[1].strip()
-                else:
-                    answer = full_response
-                    justification = "Based on the document content provided."
-            else:
-                answer = full_response
-                justification = "Response is grounded in the document content."
+            if question_embedding is not None:
+                self.cache.add("answer", scope, question_embedding, [answer, justification])
             
             return answer, justification
             
         except Exception as e:
             return f"Error answering question: {str(e)}", ""
     
+    def answer_question_stream(self, question: str, document_text: str, context_history: List[Dict] = None) -> Iterator[str]:
+        """
+        Stream the answer to a question as it is generated
+        
+        Yields the raw response text, answer followed by its justification.
+        Split the accumulated text with split_answer() once the stream ends.
+        
+        Args:
+            question: User's question
+            document_text: Full document text
+            context_history: Previous conversation context
+            
+        Returns:
+            Iterator over response text chunks
+        """
+        return iter_async(self._aanswer_question_stream(
+            question, document_text, context_history, self.document_index(document_text)
+        ))
+    
+    async def _aanswer_question_stream(self, question: str, document_text: str, context_history: List[Dict] = None,
+                                       index: Optional[DocumentIndex] = None) -> AsyncIterator[str]:
+        """Async implementation of answer_question_stream"""
+        try:
+            scope = self._answer_scope(self.document_hash(document_text), context_history)
+            cached, question_embedding = await self._alookup_answer(question, scope)
+            if cached is not None:
+                yield f"{cached[0]}\n\nJustification: {cached[1]}"
+                return
+            
+            chunks = []
+            async for chunk in self._astream_completion(
+                self._build_answer_messages(question, document_text, context_history, question_embedding, index),
+                max_tokens=400
+            ):
+                chunks.append(chunk)
+                yield chunk
+            
+            if question_embedding is not None:
+                answer, justification = self.split_answer("".join(chunks))
+                self.cache.add("answer", scope, question_embedding, [answer, justification])
+            
+        except Exception as e:
+            yield f"Error answering question: {str(e)}"
+    
+    def _answer_scope(self, doc_hash: str, context_history: Optional[List[Dict]]) -> str:
+        """
+        Return the semantic cache scope of an answer
+        
+        The answer prompt includes the last ANSWER_CONTEXT_EXCHANGES exchanges,
+        so the scope is the document plus a hash of those exchanges. A
+        follow-up such as "Can you elaborate?" then only matches answers given
+        after the same conversation, and questions asked without history share
+        one scope per document.
+        """
+        if not context_history:
+            return doc_hash
+        exchanges = [[entry['question'], entry['answer']] for entry in context_history[-ANSWER_CONTEXT_EXCHANGES:]]
+        return f"{doc_hash}:{blake3.blake3(json.dumps(exchanges).encode()).hexdigest()}"
+    
+    async def _alookup_answer(self, question: str, scope: str) -> Tuple[Optional[Tuple[str, str]], Optional[np.ndarray]]:
+        """Return (cached (answer, justification) or None, question embedding or None)"""
+        try:
+            question_embedding = await self._aembed(question)
+        except Exception:
+            return None, None
+        
+        cached = self.cache.lookup("answer", scope, question_embedding)
+        return (cached[0], cached[1]) if cached is not None else None, question_embedding
+    
+    def _build_answer_messages(self, question: str, document_text: str, context_history: Optional[List[Dict]],
+                               question_embedding: Optional[np.ndarray] = None,
+                               index: Optional[DocumentIndex] = None) -> List[Dict]:
+        """
+        Build the messages used to answer a question
+        
+        For indexed documents the excerpt is made of the chunks most similar to
+        the question; otherwise the shared document excerpt is used.
+        """
+        # Build context from history
+        context = ""
+        if context_history:
+            context = "\n\nPrevious conversation:\n"
+            for entry in context_history[-ANSWER_CONTEXT_EXCHANGES:]:
+                context += f"Q: {entry['question']}\nA: {entry['answer']}\n"
+        
+        prompt = f"""
+        Answer the user's question based ONLY on the information provided in the document.
+        {context}
+        
+        Question: {question}
+        
+        Please provide your answer followed by a justification that references specific parts of the document.
+        
+        Answer:
+        """
+        
+        if index is None or question_embedding is None:
+            return self._document_messages(document_text, prompt, index)
+        
+        return [
+            {"role": "system", "content": self._system_message(index.search(question_embedding, ANSWER_TOP_K))},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def split_answer(self, response_text: str) -> Tuple[str, str]:
+        """Separate a response into (answer, justification)"""
+        full_response = response_text.strip()
+        
+        if "justification:" in full_response.lower():
+            parts = full_response.split("Justification:", 1)
+            if len(parts) == 2:
+                return parts[0].strip(), parts[1].strip()
+            return full_response, "Based on the document content provided."
+        
+        return full_response, "Response is grounded in the document content."
+    
     def evaluate_user_answer(self, question: str, user_answer: str, correct_info: str, document_text: str) -> Tuple[str, str, int]:
         """
         Evaluate user's answer to a challenge question
@@ -163,62 +826,184 @@ class AIAssistant:
         Returns:
             Tuple of (evaluation, feedback, score_out_of_10)
         """
+        return run_many([self._aevaluate_user_answer(
+            question, user_answer, correct_info, document_text, self.document_index(document_text)
+        )])[0]
+    
+    async def _aevaluate_user_answer(self, question: str, user_answer: str, correct_info: str, document_text: str,
+                                     index: Optional[DocumentIndex] = None) -> Tuple[str, str, int]:
+        """Async implementation of evaluate_user_answer"""
         try:
-            truncated_text = self.truncate_text(document_text, 2000)
-            
-            prompt = f"""
-            You are evaluating a user's answer to a comprehension question about a document.
-            
-            Document excerpt:
-            {truncated_text}
+            cache_key = blake3.blake3(json.dumps(
+                [self.document_hash(document_text), question, user_answer, correct_info]
+            ).encode()).hexdigest()
+            cached = self.cache.get("evaluation", cache_key)
+            if cached is not None:
+                return cached[0], cached[1], cached[2]
             
-            Question: {question}
+            response = await self._acreate_completion(
+                self._build_evaluation_messages(question, user_answer, correct_info, document_text, index),
+                max_tokens=300,
+                response_format=EVALUATION_RESPONSE_FORMAT
+            )
             
-            Expected information: {correct_info}
+            evaluation, feedback, score = self._parse_evaluation(response.choices[0].message.content)
+            self.cache.set("evaluation", cache_key, [evaluation, feedback, score])
+            return evaluation, feedback, score
             
-            User's answer: {user_answer}
+        except Exception as e:
+            return "Error", f"Error evaluating answer: {str(e)}", 0
+    
+    def evaluate_user_answers(self, items: List[Tuple[str, str, str]], document_text: str) -> List[Tuple[str, str, int]]:
+        """
+        Evaluate several answers submitted together in a single request
+        
+        Args:
+            items: List of (question, user_answer, correct_info) tuples
+            document_text: Full document text
             
-            Please evaluate the user's answer and provide:
-            1. A brief evaluation (Correct/Partially Correct/Incorrect)
-            2. Constructive feedback with reference to the document
-            3. A score from 1-10
+        Returns:
+            List of (evaluation, feedback, score_out_of_10) tuples in input order
+        """
+        return run_many([self._aevaluate_user_answers(items, document_text, self.document_index(document_text))])[0]
+    
+    async def _aevaluate_user_answers(self, items: List[Tuple[str, str, str]], document_text: str,
+                                      index: Optional[DocumentIndex] = None) -> List[Tuple[str, str, int]]:
+        """Async implementation of evaluate_user_answers"""
+        try:
+            answers = ""
+            for i, (question, user_answer, correct_info) in enumerate(items, 1):
+                answers += f"\n{i}. Question: {question}\n   Expected information: {correct_info}\n   User's answer: {user_answer}\n"
             
-            Format your response as:
-            Evaluation: [Correct/Partially Correct/Incorrect]
-            Feedback: [Your feedback with document references]
-            Score: [1-10]
+            prompt = f"""
+            You are evaluating a user's answers to {len(items)} comprehension questions about the document.
+            {answers}
+            Return one evaluation per answer, in the same order, each with:
+            - evaluation: Correct, Partially Correct or Incorrect
+            - feedback: constructive feedback with reference to the document
+            - score: 1-10
             """
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=self.temperature
+            response = await self._acreate_completion(
+                self._document_messages(document_text, prompt, index),
+                max_tokens=300 * len(items),
+                response_format=BULK_EVALUATION_RESPONSE_FORMAT
             )
             
-            full_response = response.choices[0].message.content.strip()
-            
-            # Parse response
-            lines = full_response.split('\n')
-            evaluation = "Partially Correct"
-            feedback = full_response
-            score = 5
-            
-            for line in lines:
-                if line.startswith("Evaluation:"):
-                    evaluation = line.replace("Evaluation:", "").strip()
-                elif line.startswith("Feedback:"):
-                    feedback = line.replace("Feedback:", "").strip()
-                elif line.startswith("Score:"):
-                    try:
-                        score = int(line.replace("Score:", "").strip())
-                    except:
-                        score = 5
+            results = orjson.loads(response.choices[0].message.content)["evaluations"]
             
-            return evaluation, feedback, score
+            evaluations = []
+            for i in range(len(items)):
+                if i < len(results):
+                    evaluations.append(self._evaluation_tuple(results[i]))
+                else:
+                    evaluations.append(("Error", "No evaluation was returned for this answer", 0))
+            
+            return evaluations
             
         except Exception as e:
-            return "Error", f"Error evaluating answer: {str(e)}", 0
+            return [("Error", f"Error evaluating answers: {str(e)}", 0)] * len(items)
+    
+    def submit_evaluations_batch(self, items: List[Tuple[str, str, str]], document_text: str) -> str:
+        """
+        Queue several answers for grading through the OpenAI Batch API
+        
+        Batch jobs cost half as much as realtime calls but may take up to the
+        completion window to finish, so this returns immediately; collect the
+        grades later with fetch_evaluations_batch.
+        
+        Args:
+            items: List of (question, user_answer, correct_info) tuples
+            document_text: Full document text
+            
+        Returns:
+            ID of the submitted batch
+        """
+        return run_many([self._asubmit_evaluations_batch(items, document_text, self.document_index(document_text))])[0]
+    
+    async def _asubmit_evaluations_batch(self, items: List[Tuple[str, str, str]], document_text: str,
+                                         index: Optional[DocumentIndex] = None) -> str:
+        """Async implementation of submit_evaluations_batch; API errors propagate"""
+        requests = []
+        for i, (question, user_answer, correct_info) in enumerate(items):
+            messages = self._build_evaluation_messages(question, user_answer, correct_info, document_text, index)
+            requests.append(batch_client.build_request(f"eval-{i}", {
+                "model": self.model,
+                "messages": messages,
+                "max_tokens": 300,
+                "temperature": self.temperature,
+                "response_format": EVALUATION_RESPONSE_FORMAT
+            }))
+        
+        return await batch_client.submit_batch(self.client, requests, retry=with_rate_limit_backoff)
+    
+    def fetch_evaluations_batch(self, batch_id: str, num_items: int) -> Optional[List[Tuple[str, str, int]]]:
+        """
+        Collect the grades of a batch queued with submit_evaluations_batch
+        
+        Args:
+            batch_id: ID returned by submit_evaluations_batch
+            num_items: Number of answers in the batch
+            
+        Returns:
+            List of (evaluation, feedback, score_out_of_10) tuples in input order,
+            or None while the batch is still running
+        """
+        return run_many([self._afetch_evaluations_batch(batch_id, num_items)])[0]
+    
+    async def _afetch_evaluations_batch(self, batch_id: str, num_items: int) -> Optional[List[Tuple[str, str, int]]]:
+        """Async implementation of fetch_evaluations_batch"""
+        try:
+            results = await batch_client.poll_batch(self.client, batch_id)
+        except asyncio.TimeoutError:
+            # The status check was slow; try again on a later rerun
+            return None
+        except Exception as e:
+            return [("Error", f"Error evaluating answers: {str(e)}", 0)] * num_items
+        
+        if results is None:
+            return None
+        
+        evaluations = []
+        for i in range(num_items):
+            content = batch_client.response_content(results.get(f"eval-{i}"))
+            if content is None:
+                evaluations.append(("Error", "Batch evaluation failed for this answer", 0))
+            else:
+                try:
+                    evaluations.append(self._parse_evaluation(content))
+                except Exception as e:
+                    evaluations.append(("Error", f"Error evaluating answer: {str(e)}", 0))
+        
+        return evaluations
+    
+    def _build_evaluation_messages(self, question: str, user_answer: str, correct_info: str, document_text: str,
+                                   index: Optional[DocumentIndex] = None) -> List[Dict]:
+        """Build the messages used to grade a single answer"""
+        prompt = f"""
+        You are evaluating a user's answer to a comprehension question about the document.
+        
+        Question: {question}
+        
+        Expected information: {correct_info}
+        
+        User's answer: {user_answer}
+        
+        Evaluate the user's answer and return:
+        - evaluation: Correct, Partially Correct or Incorrect
+        - feedback: constructive feedback with reference to the document
+        - score: 1-10
+        """
+        
+        return self._document_messages(document_text, prompt, index)
+    
+    def _parse_evaluation(self, response_text: str) -> Tuple[str, str, int]:
+        """Parse a structured evaluation response into (evaluation, feedback, score)"""
+        return self._evaluation_tuple(orjson.loads(response_text))
+    
+    def _evaluation_tuple(self, data: Dict) -> Tuple[str, str, int]:
+        """Convert an object matching EVALUATION_SCHEMA into (evaluation, feedback, score)"""
+        return data["evaluation"], data["feedback"].strip(), int(data["score"])
     
     def add_to_conversation_history(self, question: str, answer: str):
         """Add Q&A pair to conversation history"""
@@ -233,4 +1018,10 @@ class AIAssistant:
     
     def clear_conversation_history(self):
         """Clear conversation history"""
-        st.session_state.conversation_history = []
\ No newline at end of file
+        st.session_state.conversation_history = []
+
+
+@st.cache_resource
+def get_ai_assistant() -> AIAssistant:
+    """Return the process-wide assistant, so its client and tokenizer are built once"""
+    return AIAssistant()
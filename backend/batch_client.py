@@ -0,0 +1,126 @@
+"""
+Batch Client Module
+Submits chat completion requests through the OpenAI Batch API
+"""
+
+import json
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+POLL_TIMEOUT_SECONDS = 15.0
+
+
+def build_request(custom_id: str, body: Dict) -> Dict:
+    """Build one JSONL line of a chat completions batch"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body
+    }
+
+
+async def _call_once(make_request: Callable[[], Awaitable]):
+    """Await make_request() without retrying"""
+    return await make_request()
+
+
+async def submit_batch(client, requests: List[Dict],
+                       retry: Callable[[Callable[[], Awaitable]], Awaitable] = _call_once) -> str:
+    """
+    Upload the requests as a JSONL file and create a batch from it
+
+    The upload and the batch creation are retried separately, so a failed
+    creation does not upload the file again. If the creation still fails,
+    the uploaded file is deleted rather than left orphaned.
+
+    Args:
+        client: openai.AsyncOpenAI client
+        requests: Request lines built with build_request
+        retry: Awaits a request factory with retries (e.g. ai_assistant.with_rate_limit_backoff)
+
+    Returns:
+        ID of the created batch
+    """
+    payload = "\n".join(json.dumps(request) for request in requests).encode("utf-8")
+    batch_file = await retry(lambda: client.files.create(file=("batch.jsonl", payload), purpose="batch"))
+
+    try:
+        batch = await retry(lambda: client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=COMPLETION_WINDOW
+        ))
+    except Exception:
+        try:
+            await client.files.delete(batch_file.id)
+        except Exception:
+            pass
+        raise
+    return batch.id
+
+
+async def poll_batch(client, batch_id: str, timeout: float = POLL_TIMEOUT_SECONDS) -> Optional[Dict[str, Dict]]:
+    """
+    Check a batch once and return its results if it has finished
+    
+    Batches can take up to the completion window, so callers poll on later
+    reruns instead of waiting; the check itself is bounded by timeout.
+    
+    Args:
+        client: openai.AsyncOpenAI client
+        batch_id: ID returned by submit_batch
+        timeout: Seconds allowed for the status check and result download
+        
+    Returns:
+        Result records keyed by custom_id, or None while the batch is still running
+    """
+    async def check():
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status not in TERMINAL_STATUSES:
+            return None
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+        return await fetch_results(client, batch)
+    
+    return await asyncio.wait_for(check(), timeout)
+
+
+async def fetch_results(client, batch) -> Dict[str, Dict]:
+    """
+    Download the output file of a completed batch
+
+    Args:
+        client: openai.AsyncOpenAI client
+        batch: Completed batch object
+
+    Returns:
+        Result records keyed by custom_id
+    """
+    if not batch.output_file_id:
+        return {}
+
+    content = await client.files.content(batch.output_file_id)
+
+    results = {}
+    for line in content.text.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            results[record["custom_id"]] = record
+
+    return results
+
+
+def response_content(record: Optional[Dict]) -> Optional[str]:
+    """Extract the assistant message from a batch result record, or None if it failed"""
+    if not record or record.get("error"):
+        return None
+
+    response = record.get("response") or {}
+    if response.get("status_code") != 200:
+        return None
+
+    return response["body"]["choices"][0]["message"]["content"]
@@ -4,9 +4,52 @@ Handles PDF and TXT file processing for the Smart Research Assistant
 """
 
 import os
-import PyPDF2
-from typing import Optional, Tuple
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import blake3
+from typing import Callable, Iterator, Optional, Sequence, Tuple
+import numpy as np
 import streamlit as st
+from backend.pdf_worker import count_pages, extract_document, extract_page_range, iter_pages_pypdf2
+from backend.semantic_cache import CACHE_DIR
+
+# Extracted text and token arrays of processed files, keyed by content hash
+DOCUMENT_CACHE_DIR = os.path.join(CACHE_DIR, "documents")
+
+# PDFs are extracted in worker processes so the Streamlit server stays responsive.
+# Those with at least this many pages are also split across several workers;
+# below it, pickling the file to each worker costs more than it saves.
+PARALLEL_MIN_PAGES = 48
+PDF_WORKERS = min(8, os.cpu_count() or 1)
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+_pdf_executor_lock = threading.Lock()
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Return the shared process pool used for PDF extraction"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # spawn rather than fork: the Streamlit server process is multi-threaded
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+    return _pdf_executor
+
+
+def _discard_pdf_executor(executor: ProcessPoolExecutor):
+    """Drop a broken pool so the next extraction starts a fresh one"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        # Another session may already have replaced it
+        if _pdf_executor is executor:
+            _pdf_executor = None
+    executor.shutdown(wait=False)
 
 class DocumentProcessor:
     """Handles document upload and text extraction"""
@@ -14,6 +57,10 @@ class DocumentProcessor:
     def __init__(self):
         self.supported_formats = ['.pdf', '.txt']
         self.max_file_size = 10 * 1024 * 1024  # 10MB limit
+        self.cache_dir = DOCUMENT_CACHE_DIR
+        
+        # Last uploaded file hashed, so the text and token caches share one hash
+        self._hash_memo: Optional[Tuple[object, str]] = None
     
     def validate_file(self, uploaded_file) -> Tuple[bool, str]:
         """
@@ -50,18 +97,7 @@ class DocumentProcessor:
             Extracted text content
         """
         try:
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            text_content = ""
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text.strip():
-                        text_content += f"\n--- Page {page_num + 1} ---\n"
-                        text_content += page_text
-                except Exception as e:
-                    st.warning(f"Could not extract text from page {page_num + 1}: {str(e)}")
-                    continue
+            text_content = "".join(self._format_pages(self._extract_pdf_pages(uploaded_file.getvalue())))
             
             if not text_content.strip():
                 raise ValueError("No text could be extracted from the PDF")
@@ -71,6 +107,64 @@ class DocumentProcessor:
         except Exception as e:
             raise ValueError(f"Error processing PDF: {str(e)}")
     
+    def _extract_pdf_pages(self, pdf_bytes: bytes):
+        """
+        Extract page texts with PDFium (C++), which is much faster than PyPDF2 on large files
+        
+        Extraction runs in worker processes rather than on the script thread, so
+        it does not compete with the Streamlit server for the GIL; only the raw
+        bytes are sent to the workers. Large PDFs are split into page ranges
+        extracted in parallel. PDFium is not thread-safe, so every PDFium call
+        (even the page count) happens in a worker and a thread pool is not an
+        option.
+        
+        If a worker dies (e.g. PDFium crashes on a malformed file, or runs out
+        of memory) the pool is replaced and the extraction retried once; a file
+        that kills workers twice is parsed with PyPDF2 in this process instead.
+        """
+        for _ in range(2):
+            executor = _get_pdf_executor()
+            try:
+                return self._extract_pdf_pages_in_pool(executor, pdf_bytes)
+            except BrokenProcessPool:
+                _discard_pdf_executor(executor)
+        
+        return list(iter_pages_pypdf2(pdf_bytes))
+    
+    def _extract_pdf_pages_in_pool(self, executor: ProcessPoolExecutor, pdf_bytes: bytes):
+        """Extract page texts in the worker pool"""
+        # result() waits without holding the GIL
+        num_pages = executor.submit(count_pages, pdf_bytes).result()
+        
+        if num_pages >= PARALLEL_MIN_PAGES and PDF_WORKERS >= 2:
+            return self._extract_pages_parallel(executor, pdf_bytes, num_pages)
+        
+        # A file PDFium cannot open (0 pages) falls back to PyPDF2 in the worker
+        return executor.submit(extract_document, pdf_bytes).result()
+    
+    def _extract_pages_parallel(self, executor: ProcessPoolExecutor, pdf_bytes: bytes, num_pages: int):
+        """Extract pages across the worker pool, returning results in page order"""
+        # A few ranges per worker keeps the pool balanced when page sizes vary
+        chunk_size = -(-num_pages // (PDF_WORKERS * 2))
+        
+        futures = [
+            executor.submit(extract_page_range, pdf_bytes, start, min(start + chunk_size, num_pages))
+            for start in range(0, num_pages, chunk_size)
+        ]
+        
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    
+    def _format_pages(self, pages) -> Iterator[str]:
+        """Yield page texts with page markers, warning about pages that failed"""
+        for page_num, page_text, error in pages:
+            if error is not None:
+                st.warning(f"Could not extract text from page {page_num + 1}: {error}")
+            elif page_text.strip():
+                yield f"\n--- Page {page_num + 1} ---\n{page_text}"
+    
     def extract_text_from_txt(self, uploaded_file) -> str:
         """
         Extract text content from TXT file
@@ -115,6 +209,12 @@ class DocumentProcessor:
             if not is_valid:
                 return False, "", error_msg
             
+            # Re-uploads of a file processed before skip extraction entirely
+            file_hash = self.file_hash(uploaded_file)
+            cached_text = self._load_cached_text(file_hash)
+            if cached_text is not None:
+                return True, cached_text, ""
+            
             # Extract text based on file type
             file_extension = os.path.splitext(uploaded_file.name)[1].lower()
             
@@ -129,11 +229,78 @@ class DocumentProcessor:
             if not text_content or len(text_content.strip()) < 50:
                 return False, "", "Document appears to be empty or too short to process"
             
+            self._save_cached_text(file_hash, uploaded_file.name, text_content)
             return True, text_content, ""
         
         except Exception as e:
             return False, "", str(e)
     
+    def file_hash(self, uploaded_file) -> str:
+        """Return the BLAKE3 hex digest of the file contents, memoized for the last file seen"""
+        memo = self._hash_memo
+        if memo is not None and memo[0] is uploaded_file:
+            return memo[1]
+        
+        # BLAKE3 is SIMD-accelerated and several times faster than SHA-256 on large files
+        digest = blake3.blake3(uploaded_file.getvalue()).hexdigest()
+        self._hash_memo = (uploaded_file, digest)
+        return digest
+    
+    def load_or_encode_tokens(self, uploaded_file, text_content: str,
+                              encode: Callable[[str], Sequence[int]]) -> np.ndarray:
+        """
+        Return the token array of a processed file, from the disk cache when possible
+        
+        Tokens are stored as int32 .npy files and memory-mapped on reload, so a
+        re-upload does not run the tokenizer again.
+        
+        Args:
+            uploaded_file: Streamlit uploaded file object
+            text_content: Text returned by process_document
+            encode: Tokenizer used on a cache miss (e.g. AIAssistant.encode_document)
+            
+        Returns:
+            Token array of the document
+        """
+        path = os.path.join(self.cache_dir, f"{self.file_hash(uploaded_file)}.tokens.npy")
+        
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+        
+        tokens = np.asarray(encode(text_content), dtype=np.int32)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, tokens)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # caching is best-effort
+        
+        return tokens
+    
+    def _load_cached_text(self, file_hash: str) -> Optional[str]:
+        """Return the cached extracted text for a file hash, or None"""
+        try:
+            with open(os.path.join(self.cache_dir, f"{file_hash}.json"), encoding="utf-8") as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _save_cached_text(self, file_hash: str, file_name: str, text_content: str):
+        """Write the extracted text of a file to the disk cache"""
+        path = os.path.join(self.cache_dir, f"{file_hash}.json")
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"name": file_name, "text": text_content}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # caching is best-effort
+    
     def save_uploaded_file(self, uploaded_file, upload_dir: str = "uploads") -> str:
         """
         Save uploaded file to disk
@@ -0,0 +1,98 @@
+"""
+PDF Worker Module
+Page-level PDF text extraction with PDFium, safe to run in worker processes
+"""
+
+import io
+import PyPDF2
+import pypdfium2 as pdfium
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# (page_index, text, error_message)
+PageResult = Tuple[int, str, Optional[str]]
+
+
+def extract_pages(pdf, page_indices: Iterable[int]) -> List[PageResult]:
+    """
+    Extract text from the given pages of an open PdfDocument
+
+    Args:
+        pdf: Open pypdfium2 PdfDocument
+        page_indices: Zero-based page indices to extract
+
+    Returns:
+        List of (page_index, text, error_message) tuples
+    """
+    results = []
+
+    for page_index in page_indices:
+        try:
+            page = pdf[page_index]
+            try:
+                textpage = page.get_textpage()
+                page_text = textpage.get_text_range().replace("\r\n", "\n")
+                textpage.close()
+            finally:
+                page.close()
+            results.append((page_index, page_text, None))
+        except pdfium.PdfiumError as e:
+            results.append((page_index, "", str(e)))
+
+    return results
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, stop: int) -> List[PageResult]:
+    """
+    Open the PDF and extract text from pages [start, stop)
+
+    PDFium is not thread-safe, so parallel extraction runs this in separate
+    processes, each with its own document handle.
+    """
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return extract_pages(pdf, range(start, stop))
+    finally:
+        pdf.close()
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    """Return the number of pages, or 0 if PDFium cannot open the file"""
+    try:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+    except pdfium.PdfiumError:
+        return 0
+    
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def extract_document(pdf_bytes: bytes) -> List[PageResult]:
+    """
+    Extract text from every page, falling back to PyPDF2 for files PDFium rejects
+
+    Runs in a worker process, so neither the extraction nor PyPDF2's
+    pure-Python parsing holds the GIL of the Streamlit server.
+    """
+    try:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+    except pdfium.PdfiumError:
+        # PDFium rejects some malformed files that PyPDF2 can still read
+        return list(iter_pages_pypdf2(pdf_bytes))
+
+    try:
+        return extract_pages(pdf, range(len(pdf)))
+    finally:
+        pdf.close()
+
+
+def iter_pages_pypdf2(pdf_bytes: bytes) -> Iterator[PageResult]:
+    """Yield (page_index, text, error_message) for each page using PyPDF2"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+
+    for page_index, page in enumerate(pdf_reader.pages):
+        try:
+            yield page_index, page.extract_text(), None
+        except Exception as e:
+            yield page_index, "", str(e)
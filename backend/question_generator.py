@@ -4,131 +4,436 @@ Generates challenge questions from document content
 """
 
 import os
+import asyncio
+import functools
 import openai
-from typing import List, Dict, Tuple
+import blake3
+from typing import Any, AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple
 import json
+import orjson
+import msgspec
+import numpy as np
 import streamlit as st
 from dotenv import load_dotenv
+from backend.ai_assistant import (
+    CHALLENGE_QUESTION_DECODER, MAX_TOKENS_PER_QUESTION, AIAssistant, ChallengeQuestion, clean_question, get_ai_assistant,
+    get_http_client, iter_async, run_many, with_rate_limit_backoff
+)
+from backend.semantic_cache import EMBEDDING_MODEL, get_semantic_cache
 
 # Load environment variables
 load_dotenv()
 
+# Instruction for each kind of specific question
+QUESTION_TYPE_PROMPTS = {
+    'comprehension': "Generate a question that tests understanding of the main concepts in the document.",
+    'analysis': "Generate a question that requires analyzing relationships or patterns in the document.",
+    'inference': "Generate a question that requires making logical inferences from the document content.",
+    'application': "Generate a question that asks how the information could be applied or used."
+}
+
+# Prompt templates, filled with str.format
+CHALLENGE_PROMPT = """
+Based on the following document, generate exactly {num_questions} challenging questions that test:
+1. Reading comprehension
+2. Critical thinking
+3. Analysis and inference
+4. Understanding of key concepts
+
+Document:
+{document}
+
+For each question, provide:
+- The question text
+- The expected answer or key points
+- Difficulty level (Easy/Medium/Hard)
+
+Generate questions that require understanding the document content, not just memorization.
+Avoid simple factual questions. Focus on analysis, comparison, inference, and application.
+
+Format your response as a JSON object containing all {num_questions} questions:
+{{
+    "questions": [
+        {{
+            "question": "Your question here",
+            "expected_answer": "Key points for the answer",
+            "difficulty": "Easy/Medium/Hard",
+            "type": "comprehension/analysis/inference"
+        }}
+    ]
+}}
+"""
+
+SPECIFIC_QUESTION_PROMPT = """
+Based on the following document, {instruction}
+
+Document:
+{document}
+
+Provide:
+1. A challenging question
+2. Key points for the expected answer
+3. Difficulty level
+
+Question:
+"""
+
+# Specific question prompts with the instruction for each type already filled in
+SPECIFIC_QUESTION_PROMPTS = {
+    qtype: SPECIFIC_QUESTION_PROMPT.format(instruction=instruction, document="{document}")
+    for qtype, instruction in QUESTION_TYPE_PROMPTS.items()
+}
+
+DIGEST_PROMPT = """
+Summarize the key claims, entities, arguments, findings and conclusions of the
+following document in 500 tokens or less. Keep the specific facts, numbers and
+terminology that questions about the document could refer to.
+
+Document:
+{document}
+
+Digest:
+"""
+
+BATCH_QUESTION_PROMPT = """
+Based on the following document, generate one challenging question for each of these types:
+{instructions}
+
+Document:
+{document}
+
+Format your response as a JSON object with one entry per type:
+{{
+    "<type>": {{
+        "question": "Your question here",
+        "expected_answer": "Key points for the answer",
+        "difficulty": "Easy/Medium/Hard"
+    }}
+}}
+"""
+
+
+class QuestionStreamParser:
+    """
+    Decode the questions in the first JSON array of a response, in a single pass
+    
+    Bracket depth and string state are tracked across chunks, so when a
+    {"questions": [...]} response is streamed each question is decoded as soon
+    as its closing brace arrives. Each object's text goes straight to
+    CHALLENGE_QUESTION_DECODER; incomplete or malformed questions are skipped.
+    Fed a whole response that fails to parse (e.g. cut off at max_tokens), it
+    recovers the questions that are complete.
+    """
+    
+    def __init__(self):
+        self._depth = 0
+        self._array_depth: Optional[int] = None
+        self._in_string = False
+        self._escaped = False
+        self._current: Optional[List[str]] = None
+    
+    def feed(self, text: str) -> List[ChallengeQuestion]:
+        """Consume the next chunk of the response and return the valid questions it completed"""
+        completed = []
+        
+        for char in text:
+            if self._current is not None:
+                self._current.append(char)
+            
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._array_depth is None:
+                    self._array_depth = self._depth
+                elif char == "{" and self._current is None and self._depth - 1 == self._array_depth:
+                    self._current = [char]
+            elif char in "}]":
+                self._depth -= 1
+                if self._current is not None and self._depth == self._array_depth:
+                    try:
+                        completed.append(CHALLENGE_QUESTION_DECODER.decode("".join(self._current)))
+                    except msgspec.DecodeError:
+                        pass
+                    self._current = None
+        
+        return completed
+
 class QuestionGenerator:
     """Generates logic-based and comprehension questions from documents"""
     
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "gpt-3.5-turbo"
+    def __init__(self, ai_assistant: Optional[AIAssistant] = None):
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=get_http_client(),
+            max_retries=0  # with_rate_limit_backoff retries instead
+        )
+        self.model = "gpt-4o-mini"
         self.temperature = 0.3  # Slightly higher for more diverse questions
+        self.cache = get_semantic_cache()
+        
+        # Tokenizer-backed helper, shared with the app when it passes its own instance
+        self._ai = ai_assistant if ai_assistant is not None else AIAssistant()
+        # Truncation is pure, so repeat generations on a document reuse the excerpt
+        self._truncate = functools.lru_cache(maxsize=8)(self._ai.truncate_text)
+        # Digest requests by document hash, so concurrent generations share one
+        self._digest_tasks: Dict[str, asyncio.Future] = {}
+    
+    async def _achat(self, prompt: str, max_tokens: int, variant: int = 0, **options) -> str:
+        """
+        Send a throttled single-message chat request, serving repeats from the response cache
+        
+        Responses are keyed on everything that determines them (model,
+        temperature, prompt and request options) and persist across reruns and
+        restarts. Pass a different variant to get a fresh response to the
+        same prompt.
+        
+        Determinism: the same arguments always return the same response once
+        cached. On a miss the request carries a seed derived from the prompt and
+        variant, so identical requests from other processes or after a cache
+        reset sample the same output (best effort, as OpenAI's seed is), and
+        caching the response is safe.
+        
+        Args:
+            prompt: User message
+            max_tokens: Completion token limit
+            variant: Index of the response wanted for this prompt
+            **options: Extra chat completion parameters (e.g. response_format)
+            
+        Returns:
+            Stripped response text
+        """
+        cache_key = self._response_key(prompt, max_tokens, variant, options)
+        cached = self.cache.get("questions", cache_key)
+        if cached is not None:
+            return cached
+        
+        response = await self._acreate(prompt, max_tokens, variant, **options)
+        
+        response_text = response.choices[0].message.content.strip()
+        self.cache.set("questions", cache_key, response_text)
+        return response_text
+    
+    async def _astream_chat(self, prompt: str, max_tokens: int, variant: int = 0, **options) -> AsyncIterator[str]:
+        """
+        Stream a single-message chat response, sharing _achat's response cache
+        
+        A cached response is yielded in one piece; otherwise the text deltas are
+        yielded as they arrive and the full response is cached at the end.
+        """
+        cache_key = self._response_key(prompt, max_tokens, variant, options)
+        cached = self.cache.get("questions", cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        stream = await self._acreate(prompt, max_tokens, variant, stream=True, **options)
+        
+        chunks = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        
+        self.cache.set("questions", cache_key, "".join(chunks).strip())
+    
+    async def _acreate(self, prompt: str, max_tokens: int, variant: int, **options):
+        """Send a throttled single-message chat completion request, seeded for determinism"""
+        return await with_rate_limit_backoff(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=self.temperature,
+                seed=self._seed(prompt, variant),
+                **options
+            )
+        )
     
-    def generate_challenge_questions(self, document_text: str, num_questions: int = 3) -> List[Dict]:
+    def _cached_response(self, prompt: str, max_tokens: int, variant: int = 0, **options) -> Optional[str]:
+        """Return the cached response _achat would serve for these arguments, or None"""
+        return self.cache.get("questions", self._response_key(prompt, max_tokens, variant, options))
+    
+    def _response_key(self, prompt: str, max_tokens: int, variant: int, options: Dict) -> str:
+        """Hash everything that determines a response into its cache key"""
+        return blake3.blake3(json.dumps(
+            [self.model, self.temperature, prompt, max_tokens, options, variant], sort_keys=True
+        ).encode()).hexdigest()
+    
+    def _seed(self, prompt: str, variant: int) -> int:
+        """Derive a stable sampling seed from the prompt content and variant"""
+        digest = blake3.blake3(f"{variant}:{prompt}".encode()).digest(length=4)
+        return int.from_bytes(digest, "big") & 0x7FFFFFFF
+    
+    async def _alookup_similar(self, namespace: str, scope: str, truncated_text: str) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        """
+        Look for questions generated earlier from a near-identical document
+        
+        Lets slightly edited re-uploads reuse questions that an exact-match
+        cache would miss.
+        
+        Returns:
+            Tuple of (cached payload or None, document embedding or None)
+        """
+        try:
+            response = await with_rate_limit_backoff(
+                lambda: self.client.embeddings.create(model=EMBEDDING_MODEL, input=truncated_text)
+            )
+        except Exception:
+            return None, None
+        
+        embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return self.cache.lookup(namespace, scope, embedding), embedding
+    
+    def generate_challenge_questions(self, document_text: str, num_questions: int = 3, variant: int = 0) -> List[Dict]:
         """
         Generate challenge questions from document content
         
         Args:
             document_text: Full document text
             num_questions: Number of questions to generate
+            variant: Which set of questions to return; the same variant returns
+                the cached set, a new one generates a different set
             
         Returns:
             List of question dictionaries with question, answer, and difficulty
         """
         try:
-            # Truncate document if too long
-            from backend.ai_assistant import AIAssistant
-            ai_assistant = AIAssistant()
-            truncated_text = ai_assistant.truncate_text(document_text, 2500)
-            
-            prompt = f"""
-            Based on the following document, generate exactly {num_questions} challenging questions that test:
-            1. Reading comprehension
-            2. Critical thinking
-            3. Analysis and inference
-            4. Understanding of key concepts
-            
-            Document:
-            {truncated_text}
-            
-            For each question, provide:
-            - The question text
-            - The expected answer or key points
-            - Difficulty level (Easy/Medium/Hard)
-            
-            Generate questions that require understanding the document content, not just memorization.
-            Avoid simple factual questions. Focus on analysis, comparison, inference, and application.
-            
-            Format your response as a JSON array with this structure:
-            [
-                {{
-                    "question": "Your question here",
-                    "expected_answer": "Key points for the answer",
-                    "difficulty": "Easy/Medium/Hard",
-                    "type": "comprehension/analysis/inference"
-                }}
-            ]
-            
-            Questions:
-            """
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=800,
-                temperature=self.temperature
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            # Try to parse JSON response
-            try:
-                # Extract JSON from response if it's wrapped in text
-                start = response_text.find('[')
-                end = response_text.rfind(']') + 1
-                json_text = response_text[start:end]
-                
-                questions = json.loads(json_text)
-                
-                # Validate and clean questions
-                valid_questions = []
-                for q in questions:
-                    if all(key in q for key in ['question', 'expected_answer', 'difficulty']):
-                        valid_questions.append({
-                            'question': q['question'].strip(),
-                            'expected_answer': q['expected_answer'].strip(),
-                            'difficulty': q.get('difficulty', 'Medium'),
-                            'type': q.get('type', 'comprehension')
-                        })
-                
-                return valid_questions[:num_questions]
-                
-            except json.JSONDecodeError:
-                # Fallback: parse manually
-                return self._parse_questions_manually(response_text, num_questions)
-                
+            return run_many([self._agenerate_challenge_questions(document_text, num_questions, variant)])[0]
         except Exception as e:
             st.error(f"Error generating questions: {str(e)}")
             return self._generate_fallback_questions(document_text, num_questions)
     
-    def _parse_questions_manually(self, response_text: str, num_questions: int) -> List[Dict]:
-        """Manually parse questions if JSON parsing fails"""
-        questions = []
-        lines = response_text.split('\n')
+    async def a_generate_challenge_questions(self, document_text: str, num_questions: int = 3, variant: int = 0) -> List[Dict]:
+        """
+        Async version of generate_challenge_questions, for use with asyncio.gather
+        
+        Must be awaited on the shared event loop (see backend.ai_assistant.run_many),
+        which owns the client's connection pool and the request throttle. Returns
+        the fallback questions if generation fails.
+        """
+        try:
+            return await self._agenerate_challenge_questions(document_text, num_questions, variant)
+        except Exception:
+            return self._generate_fallback_questions(document_text, num_questions)
+    
+    async def _agenerate_challenge_questions(self, document_text: str, num_questions: int, variant: int) -> List[Dict]:
+        """Implementation of generate_challenge_questions; API errors propagate to the caller"""
+        # Drain the streaming implementation so both paths return the same questions
+        return [question async for question in self._agenerate_challenge_questions_stream(document_text, num_questions, variant)]
+    
+    def generate_challenge_questions_stream(self, document_text: str, num_questions: int = 3, variant: int = 0) -> Iterator[Dict]:
+        """
+        Yield challenge questions one by one as the response streams in
+        
+        Each question is decoded as soon as its JSON object is complete, so the
+        first one is available long before the whole response has been
+        generated. generate_challenge_questions collects the same generator, so
+        both return the same questions.
+        
+        Args:
+            document_text: Full document text
+            num_questions: Number of questions to generate
+            variant: Which set of questions to return, as in generate_challenge_questions
+            
+        Returns:
+            Iterator over question dictionaries
+        """
+        count = 0
+        try:
+            for question in iter_async(self._agenerate_challenge_questions_stream(document_text, num_questions, variant)):
+                count += 1
+                yield question
+        except Exception as e:
+            st.error(f"Error generating questions: {str(e)}")
+            yield from self._generate_fallback_questions(document_text, num_questions)[count:]
+    
+    async def _agenerate_challenge_questions_stream(self, document_text: str, num_questions: int, variant: int) -> AsyncIterator[Dict]:
+        """Async implementation of generate_challenge_questions_stream; API errors propagate"""
+        options = {"response_format": {"type": "json_object"}}
+        scope = f"{self.model}:{num_questions}:{variant}"
+        make_prompt = functools.partial(self._challenge_prompt, num_questions=num_questions)
+        # Same per-question budget as AIAssistant.bootstrap_document
+        max_tokens = MAX_TOKENS_PER_QUESTION * num_questions
+        embedding = None
+        if not self._has_cached_response(document_text, make_prompt, max_tokens, variant, **options):
+            cached, embedding = await self._alookup_similar("challenge_questions", scope, self._truncate(document_text, 2500))
+            if cached is not None:
+                for question in cached:
+                    yield question
+                return
         
-        current_question = {}
-        for line in lines:
-            line = line.strip()
-            if line.startswith(('1.', '2.', '3.', 'Question:', 'Q:')):
-                if current_question:
-                    questions.append(current_question)
-                    current_question = {}
-                current_question['question'] = line
-                current_question['expected_answer'] = "Based on document content"
-                current_question['difficulty'] = "Medium"
-                current_question['type'] = "comprehension"
+        prompt = make_prompt(await self._adigest(document_text))
+        valid_questions = []
+        parser = QuestionStreamParser()
+        async for delta in self._astream_chat(prompt, max_tokens=max_tokens, variant=variant, **options):
+            for q in parser.feed(delta):
+                if len(valid_questions) < num_questions:
+                    question = msgspec.structs.asdict(q)
+                    valid_questions.append(question)
+                    yield question
         
-        if current_question:
-            questions.append(current_question)
+        if embedding is not None and len(valid_questions) >= num_questions:
+            self.cache.add("challenge_questions", scope, embedding, valid_questions)
         
-        return questions[:num_questions]
+        # Top up with generic questions if the model returned too few
+        fallback = self._generate_fallback_questions(document_text, num_questions)
+        for question in fallback[len(valid_questions):]:
+            yield question
+    
+    def _challenge_prompt(self, digest: str, num_questions: int) -> str:
+        """Build the prompt for a set of challenge questions about a document digest"""
+        return CHALLENGE_PROMPT.format(num_questions=num_questions, document=digest)
+    
+    def _has_cached_response(self, document_text: str, make_prompt: Callable[[str], str],
+                             max_tokens: int, variant: int = 0, **options) -> bool:
+        """
+        Return whether the request built from the document's digest was answered before
+        
+        Lets callers skip the near-duplicate lookup (an embedding request) when
+        the exact response is already cached, without requesting a digest.
+        """
+        digest = self._cached_response(DIGEST_PROMPT.format(document=self._truncate(document_text, 2500)), 500)
+        return digest is not None and self._cached_response(make_prompt(digest), max_tokens, variant, **options) is not None
+    
+    async def _adigest(self, document_text: str) -> str:
+        """
+        Return a digest (≤500 tokens) of the document's key content
+        
+        Question prompts carry the digest instead of a 2000-2500 token excerpt,
+        so every generation after the first sends far fewer prompt tokens. The
+        digest is requested once per document: concurrent callers share the
+        in-flight request and later ones hit the response cache.
+        
+        Args:
+            document_text: Full document text
+            
+        Returns:
+            Digest text, or the truncated document if the digest request fails
+        """
+        doc_hash = self._ai.document_hash(document_text)
+        task = self._digest_tasks.get(doc_hash)
+        if task is None:
+            if len(self._digest_tasks) >= 8:
+                self._digest_tasks.pop(next(iter(self._digest_tasks)))
+            task = asyncio.ensure_future(
+                self._achat(DIGEST_PROMPT.format(document=self._truncate(document_text, 2500)), max_tokens=500)
+            )
+            self._digest_tasks[doc_hash] = task
+        
+        try:
+            return await task
+        except Exception:
+            # Forget the failure so the next call retries
+            self._digest_tasks.pop(doc_hash, None)
+            return self._truncate(document_text, 2500)
     
     def _generate_fallback_questions(self, document_text: str, num_questions: int) -> List[Dict]:
         """Generate simple fallback questions if main generation fails"""
@@ -155,66 +460,107 @@ class QuestionGenerator:
         
         return fallback_questions[:num_questions]
     
-    def generate_specific_question_types(self, document_text: str, question_type: str) -> Dict:
+    def generate_specific_question_types(self, document_text: str, question_type: str, variant: int = 0) -> Dict:
         """
         Generate a specific type of question
         
         Args:
             document_text: Full document text
             question_type: Type of question (comprehension, analysis, inference, application)
+            variant: Which question to return, as in generate_challenge_questions
             
         Returns:
             Single question dictionary
         """
+        return run_many([self.a_generate_specific_question_types(document_text, question_type, variant)])[0]
+    
+    async def a_generate_specific_question_types(self, document_text: str, question_type: str, variant: int = 0) -> Dict:
+        """Async version of generate_specific_question_types, awaited on the shared event loop"""
         try:
-            from backend.ai_assistant import AIAssistant
-            ai_assistant = AIAssistant()
-            truncated_text = ai_assistant.truncate_text(document_text, 2000)
-            
-            question_prompts = {
-                'comprehension': "Generate a question that tests understanding of the main concepts in the document.",
-                'analysis': "Generate a question that requires analyzing relationships or patterns in the document.",
-                'inference': "Generate a question that requires making logical inferences from the document content.",
-                'application': "Generate a question that asks how the information could be applied or used."
+            template = SPECIFIC_QUESTION_PROMPTS.get(question_type, SPECIFIC_QUESTION_PROMPTS['comprehension'])
+            
+            scope = f"{self.model}:{question_type}:{variant}"
+            embedding = None
+            if not self._has_cached_response(document_text, lambda digest: template.format(document=digest), 200, variant):
+                cached, embedding = await self._alookup_similar("specific_question", scope, self._truncate(document_text, 2000))
+                if cached is not None:
+                    return cached
+            
+            prompt = template.format(document=await self._adigest(document_text))
+            response_text = await self._achat(prompt, max_tokens=200, variant=variant)
+            
+            question = {
+                'question': response_text,
+                'expected_answer': f"Answer should be based on {question_type} of the document content",
+                'difficulty': "Medium",
+                'type': question_type
             }
             
-            prompt = f"""
-            Based on the following document, {question_prompts.get(question_type, question_prompts['comprehension'])}
+            if embedding is not None:
+                self.cache.add("specific_question", scope, embedding, question)
             
-            Document:
-            {truncated_text}
+            return question
             
-            Provide:
-            1. A challenging question
-            2. Key points for the expected answer
-            3. Difficulty level
+        except Exception as e:
+            return self._fallback_specific_question(question_type)
+    
+    def generate_specific_question_types_batch(self, document_text: str, question_types: List[str], variant: int = 0) -> Dict[str, Dict]:
+        """
+        Generate one question for each of several types in a single request
+        
+        Prefer this over calling generate_specific_question_types per type: the
+        document is sent once and only one round trip is paid.
+        
+        Args:
+            document_text: Full document text
+            question_types: Types of question (comprehension, analysis, inference, application)
+            variant: Which questions to return, as in generate_challenge_questions
             
-            Question:
-            """
+        Returns:
+            Question dictionary for each requested type
+        """
+        return run_many([self.a_generate_specific_question_types_batch(document_text, question_types, variant)])[0]
+    
+    async def a_generate_specific_question_types_batch(self, document_text: str, question_types: List[str],
+                                                       variant: int = 0) -> Dict[str, Dict]:
+        """Async version of generate_specific_question_types_batch, awaited on the shared event loop"""
+        try:
+            instructions = "\n".join(
+                f'- "{qtype}": {QUESTION_TYPE_PROMPTS.get(qtype, QUESTION_TYPE_PROMPTS["comprehension"])}'
+                for qtype in question_types
+            )
+            prompt = BATCH_QUESTION_PROMPT.format(instructions=instructions, document=await self._adigest(document_text))
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=self.temperature
+            response_text = await self._achat(
+                prompt,
+                max_tokens=200 * len(question_types),
+                variant=variant,
+                response_format={"type": "json_object"}
             )
+            data = orjson.loads(response_text)
             
-            response_text = response.choices[0].message.content.strip()
+            questions = {}
+            for qtype in question_types:
+                question = clean_question(data.get(qtype))
+                if question is not None:
+                    question['type'] = qtype
+                    questions[qtype] = question
+                else:
+                    questions[qtype] = self._fallback_specific_question(qtype)
             
-            return {
-                'question': response_text,
-                'expected_answer': f"Answer should be based on {question_type} of the document content",
-                'difficulty': "Medium",
-                'type': question_type
-            }
+            return questions
             
         except Exception as e:
-            return {
-                'question': f"What insights can you gain from this document regarding {question_type}?",
-                'expected_answer': "Answer should be based on document content",
-                'difficulty': "Medium",
-                'type': question_type
-            }
+            return {qtype: self._fallback_specific_question(qtype) for qtype in question_types}
+    
+    def _fallback_specific_question(self, question_type: str) -> Dict:
+        """Generic question of a type, used when generation fails"""
+        return {
+            'question': f"What insights can you gain from this document regarding {question_type}?",
+            'expected_answer': "Answer should be based on document content",
+            'difficulty': "Medium",
+            'type': question_type
+        }
     
     def validate_questions(self, questions: List[Dict], document_text: str) -> List[Dict]:
         """
@@ -227,15 +573,22 @@ class QuestionGenerator:
         Returns:
             List of validated questions
         """
-        validated_questions = []
-        
-        for question in questions:
-            # Basic validation
-            if (question.get('question') and 
-                len(question['question'].strip()) > 10 and
-                question.get('expected_answer') and
-                len(question['expected_answer'].strip()) > 5):
-                
-                validated_questions.append(question)
-        
-        return validated_questions
\ No newline at end of file
+        # The raw length bounds the stripped length, so short fields are rejected
+        # before any strip, and strip returns the same string (no copy) when
+        # there is no surrounding whitespace
+        return [
+            question for question in questions
+            if (text := question.get('question')) and len(text) > 10 and len(text.strip()) > 10
+            and (answer := question.get('expected_answer')) and len(answer) > 5 and len(answer.strip()) > 5
+        ]
+
+
+@st.cache_resource
+def get_question_generator() -> QuestionGenerator:
+    """
+    Return the process-wide question generator shared across reruns and sessions
+    
+    It reuses the shared assistant's tokenizer, so the client, prompt templates
+    and cache handles are all built once per process.
+    """
+    return QuestionGenerator(get_ai_assistant())
@@ -0,0 +1,102 @@
+"""
+Retrieval Module
+Splits documents into chunks and finds the chunks relevant to a request
+"""
+
+import faiss
+import numpy as np
+import streamlit as st
+from typing import Callable, List, Optional, Sequence
+
+# Chunk size in tokens and number of chunks sent with each request
+CHUNK_TOKENS = 500
+ANSWER_TOP_K = 6
+OVERVIEW_CHUNKS = 5
+
+MAX_CACHED_INDEXES = 8
+
+# Marks the gap between two chunks that are not adjacent in the document
+CHUNK_GAP = "\n\n[...]\n\n"
+
+
+def split_tokens(tokens: Sequence[int], chunk_tokens: int = CHUNK_TOKENS) -> np.ndarray:
+    """Return an (n, 2) array of the [start, stop) token spans of consecutive chunks"""
+    starts = np.arange(0, len(tokens), chunk_tokens)
+    return np.column_stack((starts, np.minimum(starts + chunk_tokens, len(tokens))))
+
+
+class DocumentIndex:
+    """Chunks of one document with a FAISS inner-product index over their embeddings"""
+
+    def __init__(self, chunks: List[str], embeddings: np.ndarray):
+        self.chunks = chunks
+
+        # Inner product of unit vectors is cosine similarity
+        vectors = np.array(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+
+        # The fp16 scalar quantizer keeps vectors in half precision, like the
+        # embeddings it receives, and scores them with SIMD kernels. NumPy has
+        # no half-precision BLAS, so a float16 matmul there is slower than float32.
+        self.index = faiss.IndexScalarQuantizer(
+            vectors.shape[1], faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+        self.index.add(vectors)
+
+    def search(self, query_embedding: np.ndarray, k: int = ANSWER_TOP_K) -> str:
+        """
+        Return the k chunks most similar to the query, joined in document order
+
+        Args:
+            query_embedding: Embedding of the question
+            k: Number of chunks to retrieve
+
+        Returns:
+            Document excerpt made of the retrieved chunks
+        """
+        query = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(query)
+        _, ids = self.index.search(query, min(k, len(self.chunks)))
+        return self._join(sorted(int(i) for i in ids[0] if i >= 0))
+
+    def overview(self, n: int = OVERVIEW_CHUNKS) -> str:
+        """Return the first chunk and evenly spaced chunks after it, covering the whole document"""
+        if len(self.chunks) <= n:
+            return self._join(range(len(self.chunks)))
+        return self._join(np.linspace(0, len(self.chunks) - 1, n).round().astype(int).tolist())
+
+    def _join(self, ids: Sequence[int]) -> str:
+        """Concatenate chunks by ascending id, marking gaps between non-adjacent chunks"""
+        parts = []
+        previous = None
+        for i in ids:
+            if previous is not None and i != previous + 1:
+                parts.append(CHUNK_GAP)
+            parts.append(self.chunks[i])
+            previous = i
+        return "".join(parts)
+
+
+@st.cache_resource(max_entries=MAX_CACHED_INDEXES, show_spinner=False)
+def get_document_index(doc_hash: str, _load_chunks: Callable[[], List[str]],
+                       _embed: Callable[[List[str]], np.ndarray]) -> Optional[DocumentIndex]:
+    """
+    Build the index of a document once and share it across reruns and sessions
+    
+    Look the index up here on every request rather than keeping a reference:
+    an index evicted from the cache is then rebuilt instead of silently lost.
+    Must be called on the Streamlit script thread, where the cache is shared.
+    
+    Args:
+        doc_hash: Hash of the document text; the cache key
+        _load_chunks: Returns the chunk texts of the document, or none if it is
+            too short to index; only called on a miss (not hashed)
+        _embed: Function embedding a list of texts into a matrix (not hashed)
+        
+    Returns:
+        The document index, or None for a document too short to index
+    """
+    chunks = _load_chunks()
+    if not chunks:
+        return None
+    return DocumentIndex(chunks, _embed(chunks))
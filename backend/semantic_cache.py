@@ -0,0 +1,135 @@
+"""
+Semantic Cache Module
+Reuses earlier LLM responses for repeated or near-duplicate requests
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import streamlit as st
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dataez")
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.92
+
+
+class SemanticCache:
+    """SQLite-backed response cache with exact-key and embedding-similarity lookups"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        if db_path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            db_path = os.path.join(CACHE_DIR, "responses.sqlite3")
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS exact_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE TABLE IF NOT EXISTS semantic_entries (
+                id INTEGER PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS semantic_entries_scope
+                ON semantic_entries (namespace, scope);
+        """)
+
+        # Normalized embedding matrix and payloads per (namespace, scope), loaded lazily
+        self._scopes: Dict[Tuple[str, str], Tuple[np.ndarray, List[Any]]] = {}
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return the payload stored under an exact key, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM exact_entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any):
+        """Store a JSON-serializable payload under an exact key"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO exact_entries (namespace, key, payload) VALUES (?, ?, ?)",
+                (namespace, key, json.dumps(value))
+            )
+            self._conn.commit()
+
+    def lookup(self, namespace: str, scope: str, embedding: np.ndarray,
+               threshold: float = SIMILARITY_THRESHOLD) -> Optional[Any]:
+        """
+        Return the payload of the most similar cached entry in a scope
+
+        Args:
+            namespace: Kind of response (e.g. "answer")
+            scope: Partition the search is restricted to (e.g. a document hash)
+            embedding: Query embedding
+            threshold: Minimum cosine similarity for a hit
+
+        Returns:
+            Cached payload, or None if nothing is similar enough
+        """
+        with self._lock:
+            matrix, payloads = self._load_scope(namespace, scope)
+            if not payloads:
+                return None
+
+            # One matrix-vector product scores every cached entry at once
+            scores = matrix @ _normalize(embedding)
+            best = int(np.argmax(scores))
+            return payloads[best] if scores[best] >= threshold else None
+
+    def add(self, namespace: str, scope: str, embedding: np.ndarray, value: Any):
+        """Store a payload under its embedding for later similarity lookups"""
+        vector = _normalize(embedding)
+        payload = json.dumps(value)
+
+        with self._lock:
+            matrix, payloads = self._load_scope(namespace, scope)
+            self._conn.execute(
+                "INSERT INTO semantic_entries (namespace, scope, embedding, payload) VALUES (?, ?, ?, ?)",
+                (namespace, scope, vector.astype(np.float16).tobytes(), payload)
+            )
+            self._conn.commit()
+            matrix = np.vstack([matrix, vector]) if payloads else vector[np.newaxis, :]
+            self._scopes[(namespace, scope)] = (matrix, payloads + [value])
+
+    def _load_scope(self, namespace: str, scope: str) -> Tuple[np.ndarray, List[Any]]:
+        """Load the embedding matrix for a scope from SQLite (caller holds the lock)"""
+        key = (namespace, scope)
+        if key not in self._scopes:
+            rows = self._conn.execute(
+                "SELECT embedding, payload FROM semantic_entries WHERE namespace = ? AND scope = ? ORDER BY id",
+                (namespace, scope)
+            ).fetchall()
+
+            if rows:
+                matrix = np.vstack([np.frombuffer(row[0], dtype=np.float16) for row in rows]).astype(np.float32)
+            else:
+                matrix = np.empty((0, 0), dtype=np.float32)
+            self._scopes[key] = (matrix, [json.loads(row[1]) for row in rows])
+
+        return self._scopes[key]
+
+
+def _normalize(embedding) -> np.ndarray:
+    """Return the embedding as a unit-length float32 vector"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@st.cache_resource
+def get_semantic_cache() -> SemanticCache:
+    """Return the process-wide semantic cache shared across reruns and sessions"""
+    return SemanticCache()